@@ -1,12 +1,27 @@
 import os
 import json
 import pickle
+import pickletools
+import functools
+import hashlib
+import itertools
+import math
+import operator
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+import google_auth_httplib2
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib json module
+    orjson = None
 import requests
-from datetime import datetime
-import pytz
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime, timedelta, timezone
 
 # Constants for Stock Balance
 SPECIFICATION_SHEET_ID = os.environ.get('SPECIFICATION_SHEET_ID')
@@ -25,41 +40,115 @@ INVENTORY_RANGE = 'A:BZ'  # Get all columns since we're finding them by name (ex
 PARTS_SHEET_NAME = 'parts_balance'
 PARTS_RANGE = 'A1:H3'  # Adjust range to cover all parts data
 
+# Inventory months are keyed by local (Lagos) time; Lagos is a fixed UTC+01:00 with no DST,
+# so a plain offset gives the same result as a tz database lookup
+LAGOS_TZ = timezone(timedelta(hours=1), 'WAT')
+
+# Timestamp format for the alert footer
+ALERT_TIME_FORMAT = '%Y-%m-%d %I:%M:%S %p'
+
+# Partial-response mask so batchGet only returns cell values
+VALUE_RANGES_FIELDS = 'valueRanges(values)'
+
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 SERVICE_ACCOUNT_FILE = 'service-account.json'
 
-# Set up data directory for state persistence
+# Set up data directory for state persistence (created once here; all state files live in it)
 DATA_DIR = os.getenv('GITHUB_WORKSPACE', os.getcwd())
 os.makedirs(DATA_DIR, exist_ok=True)
 
 # Separate state files for stock, parts, and differences
 STOCK_STATE_FILE = os.path.join(DATA_DIR, 'previous_stock_state.pickle')
 PARTS_STATE_FILE = os.path.join(DATA_DIR, 'previous_parts_state.pickle')
-WHOLE_CHICKEN_DIFF_STATE_FILE = os.path.join(DATA_DIR, 'previous_whole_chicken_diff_state.pickle')
-GIZZARD_DIFF_STATE_FILE = os.path.join(DATA_DIR, 'previous_gizzard_diff_state.pickle')
+# Difference states are single numbers, so they are stored as plain JSON
+WHOLE_CHICKEN_DIFF_STATE_FILE = os.path.join(DATA_DIR, 'previous_whole_chicken_diff_state.json')
+GIZZARD_DIFF_STATE_FILE = os.path.join(DATA_DIR, 'previous_gizzard_diff_state.json')
+
+# Digest of the last alert sent, used to skip re-sending an identical alert
+LAST_ALERT_HASH_FILE = os.path.join(DATA_DIR, 'last_alert_hash.json')
+
+@functools.lru_cache(maxsize=1)
+def current_year_month():
+    """Return the current year-month (YYYY-MM) in Lagos time, computed once per run."""
+    return datetime.now(LAGOS_TZ).strftime('%Y-%m')
+
+# Shared HTTP session for webhook calls so connections and TLS sessions are reused.
+# POSTs are only retried on connect failures (nothing was sent) and on 429/503 (the
+# message was not accepted). Read errors are not retried, since the webhook may
+# already have posted the message, so a retry never delivers an alert twice.
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=100,
+    max_retries=Retry(total=3, read=0, other=0, backoff_factor=0.3, status_forcelist=[429, 503],
+                      allowed_methods=frozenset({'POST'}), raise_on_status=False)
+))
+
+# Tags identifying which balance a difference change row describes
+DIFF_KIND_CHICKEN = 0
+DIFF_KIND_GIZZARD = 1
+
+# Bit flags describing which kinds of change triggered an alert
+CHANGED_STOCK = 1 << 0
+CHANGED_PARTS = 1 << 1
+CHANGED_CHICKEN_DIFF = 1 << 2
+CHANGED_GIZZARD_DIFF = 1 << 3
+CHANGED_DIFF = CHANGED_CHICKEN_DIFF | CHANGED_GIZZARD_DIFF
+
+# Webhook (connect, read) timeouts in seconds
+WEBHOOK_TIMEOUT = (3.05, 10)
 
 class APIError(Exception):
     """Custom exception for API related errors."""
     pass
 
+# Per-thread HTTP clients for Sheets requests issued from worker threads
+_thread_local = threading.local()
+
+@functools.lru_cache(maxsize=1)
+def get_credentials():
+    """Load the service account credentials once per process."""
+    return service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+
+def _thread_http():
+    """Return an authorized HTTP client owned by the current thread.
+    
+    httplib2 connections are not thread-safe, so requests made concurrently
+    must not share the service's default client. build_http() gives the same
+    socket timeout and redirect handling as the client build() creates.
+    """
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        http = google_auth_httplib2.AuthorizedHttp(get_credentials(), http=build_http())
+        _thread_local.http = http
+    return http
+
+@functools.lru_cache(maxsize=1)
 def get_service():
-    """Create and return Google Sheets service object."""
+    """Create and return Google Sheets service object, built once per process."""
     try:
-        credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        return build('sheets', 'v4', credentials=credentials)
+        credentials = get_credentials()
+        # Use the discovery document bundled with the client instead of fetching it
+        return build('sheets', 'v4', credentials=credentials,
+                     cache_discovery=False, static_discovery=True)
     except Exception as e:
         print(f"Error initializing Google Sheets service: {str(e)}")
         raise APIError("Failed to initialize Google Sheets service")
 
 def get_sheet_data(service, sheet_name, range_name):
-    """Fetch data from Google Sheet."""
+    """Fetch data from Google Sheet.
+    
+    No longer used by main(), which reads both specification ranges through
+    get_all_spec_data; kept for ad-hoc single-range fetches.
+    """
     print(f"Fetching data from sheet {sheet_name}...")
     try:
         sheet = service.spreadsheets()
         result = sheet.values().get(
             spreadsheetId=SPECIFICATION_SHEET_ID,
-            range=f'{sheet_name}!{range_name}'
+            range=f'{sheet_name}!{range_name}',
+            fields='values'
         ).execute()
         data = result.get('values', [])
         
@@ -77,26 +166,138 @@ def get_sheet_data(service, sheet_name, range_name):
         print(f"Unexpected error fetching sheet data: {str(e)}")
         raise APIError(f"Unexpected error while fetching data from {sheet_name}")
 
-def load_previous_state(state_file):
-    """Load previous state from file."""
+def get_sheets_batch(service, spreadsheet_id, ranges):
+    """Fetch several ranges from one spreadsheet in a single batchGet request.
+    
+    Returns a dict mapping each requested range to its rows (empty if no values).
+    """
+    result = service.spreadsheets().values().batchGet(
+        spreadsheetId=spreadsheet_id,
+        ranges=ranges,
+        fields=VALUE_RANGES_FIELDS
+    ).execute(http=_thread_http())
+    value_ranges = result.get('valueRanges', [])
+    # valueRanges come back in request order
+    return {
+        range_name: value_ranges[i].get('values', []) if i < len(value_ranges) else []
+        for i, range_name in enumerate(ranges)
+    }
+
+def get_all_spec_data(service):
+    """Fetch stock and parts data from the specification sheet in a single request."""
+    print(f"Fetching data from sheets {STOCK_SHEET_NAME} and {PARTS_SHEET_NAME}...")
+    stock_range = f'{STOCK_SHEET_NAME}!{STOCK_RANGE}'
+    parts_range = f'{PARTS_SHEET_NAME}!{PARTS_RANGE}'
+    try:
+        batch = get_sheets_batch(service, SPECIFICATION_SHEET_ID, [stock_range, parts_range])
+        stock_data = batch[stock_range]
+        parts_data = batch[parts_range]
+        
+        # Validate data structure
+        min_rows = 2  # Both stock and parts sheets have 2 rows
+        for sheet_name, data in ((STOCK_SHEET_NAME, stock_data), (PARTS_SHEET_NAME, parts_data)):
+            if not data or len(data) < min_rows:
+                raise APIError(f"Invalid data structure received from Google Sheets for {sheet_name}")
+                
+        print(f"Data fetched successfully from {STOCK_SHEET_NAME} and {PARTS_SHEET_NAME}")
+        return stock_data, parts_data
+    except APIError:
+        raise
+    except HttpError as e:
+        print(f"Google Sheets API error: {str(e)}")
+        raise APIError("Failed to fetch specification data from Google Sheets")
+    except Exception as e:
+        print(f"Unexpected error fetching sheet data: {str(e)}")
+        raise APIError("Unexpected error while fetching specification data")
+
+def _json_dumps(value):
+    """Serialize value to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode('utf-8')
+
+def _json_loads(data):
+    """Deserialize JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _atomic_write(state_file, data):
+    """Write bytes to state_file via a temporary file and rename.
+    
+    os.replace is atomic, so readers never see a partially written state file.
+    """
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_file, state_file)
+
+@functools.lru_cache(maxsize=16)
+def load_scalar_state(state_file):
+    """Load a single numeric difference value from a JSON state file.
+    
+    Results are memoized per path; save_scalar_state clears the cache after writing.
+    """
+    print(f"Checking for previous state file {state_file}")
+    try:
+        if os.path.exists(state_file):
+            print(f"Loading previous state from {state_file}")
+            with open(state_file, 'rb') as f:
+                data = _json_loads(f.read())
+            if not isinstance(data, (int, float)) and data is not None:
+                print("Invalid difference state data found, treating as no previous state")
+                return None
+            print("Previous state loaded successfully")
+            return data
+        print("No previous state file found")
+        return None
+    except Exception as e:
+        print(f"Error loading previous state: {str(e)}")
+        return None
+
+def save_scalar_state(value, state_file):
+    """Save a single numeric difference value to a JSON state file."""
+    if not isinstance(value, (int, float)) and value is not None:
+        print("Invalid difference state data, skipping save")
+        return
+        
+    print(f"Saving current state to {state_file}")
+    try:
+        _atomic_write(state_file, _json_dumps(value))
+        load_scalar_state.cache_clear()
+        print(f"State saved successfully to {state_file}")
+    except Exception as e:
+        print(f"Error saving state: {str(e)}")
+        raise APIError("Failed to save state file")
+
+def _canonical_row(row):
+    """Return a row as a tuple of stripped strings, the form stock and parts state is stored in."""
+    return tuple(str(cell).strip() for cell in row)
+
+def _canonical_state(rows):
+    """Return sheet rows in the canonical tuple-of-tuples form used for stored state."""
+    return tuple(_canonical_row(row) for row in rows)
+
+@functools.lru_cache(maxsize=16)
+def load_tabular_state(state_file):
+    """Load previous stock or parts rows from a pickle state file.
+    
+    Results are memoized per path; save_tabular_state clears the cache after writing.
+    """
     print(f"Checking for previous state file {state_file}")
     try:
         if os.path.exists(state_file):
             print(f"Loading previous state from {state_file}")
             with open(state_file, 'rb') as f:
                 data = pickle.load(f)
-                # Check if this is a difference state file (contains single value)
-                if 'diff_state' in state_file:
-                    # Difference state files contain single numeric values
-                    if not isinstance(data, (int, float)) and data is not None:
-                        print("Invalid difference state data found, treating as no previous state")
-                        return None
-                else:
-                    # Stock and parts state files expect 2 rows
-                    min_rows = 2
-                    if not data or len(data) < min_rows:
-                        print("Invalid state data found, treating as no previous state")
-                        return None
+                # Stock and parts state files expect 2 rows
+                min_rows = 2
+                if not data or len(data) < min_rows:
+                    print("Invalid state data found, treating as no previous state")
+                    return None
+                # State saved by older versions is a list of raw rows
+                if not isinstance(data, tuple):
+                    data = _canonical_state(data)
                 print("Previous state loaded successfully")
                 return data
         print("No previous state file found")
@@ -105,26 +306,23 @@ def load_previous_state(state_file):
         print(f"Error loading previous state: {str(e)}")
         return None
 
-def save_current_state(state, state_file):
-    """Save current state to file."""
-    # Check if this is a difference state file (contains single value)
-    if 'diff_state' in state_file:
-        # Difference state files contain single numeric values
-        if not isinstance(state, (int, float)) and state is not None:
-            print("Invalid difference state data, skipping save")
-            return
-    else:
-        # Stock and parts state files expect 2 rows
-        min_rows = 2
-        if not state or len(state) < min_rows:
-            print("Invalid state data, skipping save")
-            return
+def save_tabular_state(state, state_file):
+    """Save current stock or parts rows to a pickle state file."""
+    # Stock and parts state files expect 2 rows
+    min_rows = 2
+    if not state or len(state) < min_rows:
+        print("Invalid state data, skipping save")
+        return
         
+    # Store rows pre-stripped so change detection only has to normalize the current side
+    state = _canonical_state(state)
+    
     print(f"Saving current state to {state_file}")
     try:
-        os.makedirs(os.path.dirname(state_file), exist_ok=True)
-        with open(state_file, 'wb') as f:
-            pickle.dump(state, f)
+        # Highest protocol plus optimize() keeps state files small and fast to load each run
+        data = pickletools.optimize(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        _atomic_write(state_file, data)
+        load_tabular_state.cache_clear()
         print(f"State saved successfully to {state_file}")
     except Exception as e:
         print(f"Error saving state: {str(e)}")
@@ -138,29 +336,30 @@ def detect_stock_changes(previous_data, current_data):
     
     try:
         changes = []
-        # Skip header row and compare the balance row
+        # Skip header row and compare the balance row; previous state is already canonical
         prev_row = previous_data[1]
-        curr_row = current_data[1]
+        curr_row = _canonical_row(current_data[1])
         headers = current_data[0]
         
         # Validate data lengths
         if len(prev_row) != len(curr_row) or len(headers) != len(curr_row):
             print(f"Data length mismatch - Previous: {len(prev_row)}, Current: {len(curr_row)}, Headers: {len(headers)}")
             print("Resetting previous stock state file to match new structure.")
-            save_current_state(current_data, STOCK_STATE_FILE)
+            save_tabular_state(current_data, STOCK_STATE_FILE)
+            return []
+        
+        # Fast path: identical rows mean nothing changed, skip the per-cell comparison
+        if prev_row == curr_row:
+            print("No changes detected in stock balance")
             return []
         
         print("\nComparing stock states...")
         
-        # Compare each value and convert to same type before comparison
-        for i in range(len(prev_row)):
-            # Convert both values to strings for comparison to avoid type mismatches
-            prev_val = str(prev_row[i]).strip()
-            curr_val = str(curr_row[i]).strip()
-            
-            if prev_val != curr_val:
-                changes.append((headers[i], prev_row[i], curr_row[i]))
-                print(f"Change detected in {headers[i]}")
+        # Compare all cells in C via map/compress and only visit the positions that differ;
+        # both rows hold stripped strings so types always match
+        for i in itertools.compress(range(len(curr_row)), map(operator.ne, prev_row, curr_row)):
+            changes.append((headers[i], prev_row[i], curr_row[i]))
+            print(f"Change detected in {headers[i]}")
         
         if changes:
             print(f"Detected {len(changes)} stock changes")
@@ -185,14 +384,14 @@ def detect_parts_changes(previous_data, current_data):
             part_headers = current_data[0][1:]  # Skip "Parts Type" column
         
         # Get previous values from row 2 (starting from column B which is index 1)
-        prev_values = []
+        prev_values = ()
         if len(previous_data) > 1 and len(previous_data[1]) > 1:
             prev_values = previous_data[1][1:]  # Skip "Balance" label
         
         # Get current values from row 2 (starting from column B which is index 1)
-        curr_values = []
+        curr_values = ()
         if len(current_data) > 1 and len(current_data[1]) > 1:
-            curr_values = current_data[1][1:]  # Skip "Balance" label
+            curr_values = _canonical_row(current_data[1][1:])  # Skip "Balance" label
         
         # Validate data structure
         if len(part_headers) != len(curr_values):
@@ -208,27 +407,24 @@ def detect_parts_changes(previous_data, current_data):
         if len(prev_values) < len(curr_values):
             print(f"Warning: Previous values array ({len(prev_values)}) shorter than current ({len(curr_values)})")
             # Pad with empty strings
-            prev_values = prev_values + [''] * (len(curr_values) - len(prev_values))
+            prev_values = prev_values + ('',) * (len(curr_values) - len(prev_values))
         # If previous values array is longer, trim it
         elif len(prev_values) > len(curr_values):
             print(f"Warning: Previous values array ({len(prev_values)}) longer than current ({len(curr_values)})")
             prev_values = prev_values[:len(curr_values)]
+        
+        # Fast path: identical values mean nothing changed, skip the per-cell comparison
+        if prev_values == curr_values:
+            print("No changes detected in parts weights")
+            return []
             
         print("\nComparing parts states...")
         
-        # Compare each value and detect changes
-        for i in range(len(part_headers)):
-            if i >= len(prev_values) or i >= len(curr_values):
-                print(f"Warning: Index {i} out of bounds. Skipping comparison.")
-                continue
-                
-            # Convert both values to strings for comparison to avoid type mismatches
-            prev_val = str(prev_values[i]).strip()
-            curr_val = str(curr_values[i]).strip()
-            
-            if prev_val != curr_val:
-                changes.append((part_headers[i], prev_values[i], curr_values[i]))
-                print(f"Change detected in {part_headers[i]}")
+        # Compare all values in C via map/compress and only visit the positions that differ;
+        # compress stops at the shortest input so indices always stay in bounds
+        for i in itertools.compress(range(len(part_headers)), map(operator.ne, prev_values, curr_values)):
+            changes.append((part_headers[i], prev_values[i], curr_values[i]))
+            print(f"Change detected in {part_headers[i]}")
         
         # Total is now included in the part headers and values, so no separate check needed
         
@@ -241,231 +437,228 @@ def detect_parts_changes(previous_data, current_data):
         print(f"Error detecting parts changes: {str(e)}")
         print("Attempting to reset parts state file for next run...")
         # Save current state to recover from this error
-        save_current_state(current_data, PARTS_STATE_FILE)
+        save_tabular_state(current_data, PARTS_STATE_FILE)
         print("Parts state file updated with current data. Next run should work correctly.")
         # Return empty changes to avoid further errors
         return []
 
 def detect_chicken_difference_changes(previous_chicken_diff, current_chicken_diff):
-    """Detect changes between previous and current whole chicken inventory balance difference."""
+    """Detect changes between previous and current whole chicken inventory balance difference.
+    
+    Returns a one-element tuple of (change_type, old, new, DIFF_KIND_CHICKEN), or an
+    empty tuple.
+    """
     if previous_chicken_diff is None:
         print("No previous whole chicken difference data available")
-        return []
+        return ()
     
-    try:
-        changes = []
-        
-        print("\nComparing whole chicken difference states...")
-        
-        if current_chicken_diff is not None and previous_chicken_diff != current_chicken_diff:
-            changes.append(('Whole Chicken Balance Difference', previous_chicken_diff, current_chicken_diff))
-            print(f"Change detected in Whole Chicken Balance Difference")
-        
-        if changes:
-            print(f"Detected {len(changes)} whole chicken difference changes")
-        else:
-            print("No changes detected in whole chicken inventory balance difference")
-        return changes
-    except Exception as e:
-        print(f"Error detecting whole chicken difference changes: {str(e)}")
-        raise APIError("Failed to compare whole chicken difference states")
+    if current_chicken_diff is not None and previous_chicken_diff != current_chicken_diff:
+        print("Change detected in Whole Chicken Balance Difference")
+        return (('Whole Chicken Balance Difference', previous_chicken_diff, current_chicken_diff, DIFF_KIND_CHICKEN),)
+    print("No changes detected in whole chicken inventory balance difference")
+    return ()
 
 def detect_gizzard_difference_changes(previous_gizzard_diff, current_gizzard_diff):
-    """Detect changes between previous and current gizzard inventory balance difference."""
+    """Detect changes between previous and current gizzard inventory balance difference.
+    
+    Returns a one-element tuple of (change_type, old, new, DIFF_KIND_GIZZARD), or an
+    empty tuple.
+    """
     if previous_gizzard_diff is None:
         print("No previous gizzard difference data available")
-        return []
+        return ()
     
+    # Use small tolerance for floating point comparison
+    if current_gizzard_diff is not None and abs(previous_gizzard_diff - current_gizzard_diff) >= 0.01:
+        print("Change detected in Gizzard Balance Difference")
+        return (('Gizzard Balance Difference', previous_gizzard_diff, current_gizzard_diff, DIFF_KIND_GIZZARD),)
+    print("No changes detected in gizzard inventory balance difference")
+    return ()
+
+def get_inventory_balances(service):
+    """Fetch whole chicken and gizzard balances from the inventory sheet in one request.
+
+    Returns a (whole_chicken_balance, gizzard_balance) tuple; either value is
+    None when it cannot be determined.
+    """
+    inventory_range = f'{INVENTORY_SHEET_NAME}!{INVENTORY_RANGE}'
     try:
-        changes = []
-        
-        print("\nComparing gizzard difference states...")
-        
-        if current_gizzard_diff is not None:
-            # Use small tolerance for floating point comparison
-            if abs(previous_gizzard_diff - current_gizzard_diff) >= 0.01:
-                changes.append(('Gizzard Balance Difference', previous_gizzard_diff, current_gizzard_diff))
-                print(f"Change detected in Gizzard Balance Difference")
-        
-        if changes:
-            print(f"Detected {len(changes)} gizzard difference changes")
-        else:
-            print("No changes detected in gizzard inventory balance difference")
-        return changes
+        data = get_sheets_batch(service, INVENTORY_SHEET_ID, [inventory_range])[inventory_range]
     except Exception as e:
-        print(f"Error detecting gizzard difference changes: {str(e)}")
-        raise APIError("Failed to compare gizzard difference states")
+        print(f"Error fetching inventory balances: {str(e)}")
+        return None, None
+    return parse_inventory_balances(data)
+
+def parse_inventory_balances(data):
+    """Extract whole chicken and gizzard balances from pre-fetched inventory sheet rows.
 
-def get_inventory_balance(service):
-    """Fetch and calculate inventory balance from the inflow/release sheet."""
+    Returns a (whole_chicken_balance, gizzard_balance) tuple; either value is
+    None when it cannot be determined.
+    """
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=INVENTORY_SHEET_ID,
-            range=f'{INVENTORY_SHEET_NAME}!{INVENTORY_RANGE}'
-        ).execute()
-        
-        data = result.get('values', [])
         if not data:
             print("No data found in inventory sheet")
-            return None
+            return None, None
             
         # Get the header row to find the column indices
         if len(data) < 2:  # Need at least header row and one data row
             print("Not enough rows in inventory sheet")
-            return None
+            return None, None
             
-        headers = data[0]
-        try:
-            balance_col_index = headers.index('whole_chicken_quantity_stock_balance')
-            year_month_col_index = headers.index('year_month')
-        except ValueError as e:
-            print(f"Could not find required column in inventory sheet: {str(e)}")
-            return None
+        # Map header names to column indices once instead of scanning the row per lookup
+        header_idx = {header: i for i, header in enumerate(data[0])}
+        year_month_col_index = header_idx.get('year_month')
+        if year_month_col_index is None:
+            print("Could not find required column in inventory sheet: 'year_month'")
+            return None, None
+        balance_col_index = header_idx.get('whole_chicken_quantity_stock_balance')
+        gizzard_col_index = header_idx.get('gizzard_weight_stock_balance')
+        if balance_col_index is None:
+            print("Could not find required column in inventory sheet: 'whole_chicken_quantity_stock_balance'")
+        if gizzard_col_index is None:
+            print("Could not find required column in inventory sheet for gizzard: 'gizzard_weight_stock_balance'")
             
-        # Get current year-month in YYYY-MM format
-        current_date = datetime.now(pytz.UTC).astimezone(pytz.timezone('Africa/Lagos'))
-        current_year_month = current_date.strftime('%Y-%m')
+        current_ym = current_year_month()
         
-        # Find the row for the current month
-        data_rows = data[1:]  # Skip header row
+        # Find the row for the current month in one pass, tracking the most
+        # recent year_month seen as a fallback in case the current month is missing
         current_month_row = None
+        best_row = None
+        best_ym = ''
         
-        for row in data_rows:
-            if len(row) > year_month_col_index and row[year_month_col_index] == current_year_month:
+        for row in itertools.islice(data, 1, None):  # Skip header row
+            if len(row) <= year_month_col_index:
+                continue
+            ym = row[year_month_col_index]
+            if ym == current_ym:
                 current_month_row = row
                 break
+            if ym > best_ym:
+                best_ym = ym
+                best_row = row
         
         if not current_month_row:
-            print(f"Warning: No data found for current month ({current_year_month})")
-            # Sort by year_month in descending order to get the most recent record as fallback
-            sorted_data = sorted(data_rows, 
-                               key=lambda x: x[year_month_col_index] if len(x) > year_month_col_index else '', 
-                               reverse=True)
-            if sorted_data:
-                current_month_row = sorted_data[0]
-                print(f"Using most recent available data from {current_month_row[year_month_col_index]}")
+            print(f"Warning: No data found for current month ({current_ym})")
+            if best_row:
+                current_month_row = best_row
+                print(f"Using most recent available data from {best_ym}")
             else:
-                return None
+                return None, None
         
-        if len(current_month_row) > balance_col_index:
-            try:
-                balance = float(current_month_row[balance_col_index])
-                return balance
-            except (ValueError, TypeError):
-                print("Invalid balance value in inventory sheet")
-                return None
-        return None
+        whole_chicken_balance = _read_balance(current_month_row, balance_col_index, "Invalid balance value in inventory sheet")
+        gizzard_balance = _read_balance(current_month_row, gizzard_col_index, "Invalid gizzard balance value in inventory sheet")
+        return whole_chicken_balance, gizzard_balance
     except Exception as e:
-        print(f"Error fetching inventory balance: {str(e)}")
-        return None
+        print(f"Error reading inventory balances: {str(e)}")
+        return None, None
 
-def get_gizzard_inventory_balance(service):
-    """Fetch and calculate gizzard weight balance from the inventory sheet."""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=INVENTORY_SHEET_ID,
-            range=f'{INVENTORY_SHEET_NAME}!{INVENTORY_RANGE}'
-        ).execute()
-        
-        data = result.get('values', [])
-        if not data:
-            print("No data found in inventory sheet for gizzard")
-            return None
-            
-        # Get the header row to find the column indices
-        if len(data) < 2:  # Need at least header row and one data row
-            print("Not enough rows in inventory sheet for gizzard")
-            return None
-            
-        headers = data[0]
-        try:
-            gizzard_col_index = headers.index('gizzard_weight_stock_balance')
-            year_month_col_index = headers.index('year_month')
-        except ValueError as e:
-            print(f"Could not find required column in inventory sheet for gizzard: {str(e)}")
-            return None
-            
-        # Get current year-month in YYYY-MM format
-        current_date = datetime.now(pytz.UTC).astimezone(pytz.timezone('Africa/Lagos'))
-        current_year_month = current_date.strftime('%Y-%m')
-        
-        # Find the row for the current month
-        data_rows = data[1:]  # Skip header row
-        current_month_row = None
-        
-        for row in data_rows:
-            if len(row) > year_month_col_index and row[year_month_col_index] == current_year_month:
-                current_month_row = row
-                break
-        
-        if not current_month_row:
-            print(f"Warning: No data found for current month ({current_year_month}) for gizzard")
-            # Sort by year_month in descending order to get the most recent record as fallback
-            sorted_data = sorted(data_rows, 
-                               key=lambda x: x[year_month_col_index] if len(x) > year_month_col_index else '', 
-                               reverse=True)
-            if sorted_data:
-                current_month_row = sorted_data[0]
-                print(f"Using most recent available data from {current_month_row[year_month_col_index]} for gizzard")
-            else:
-                return None
-        
-        if len(current_month_row) > gizzard_col_index:
-            try:
-                balance = float(current_month_row[gizzard_col_index])
-                return balance
-            except (ValueError, TypeError):
-                print("Invalid gizzard balance value in inventory sheet")
-                return None
+def _read_balance(row, col_index, error_message):
+    """Return the numeric value at col_index in row, or None if missing or invalid."""
+    if col_index is None or len(row) <= col_index:
         return None
-    except Exception as e:
-        print(f"Error fetching gizzard inventory balance: {str(e)}")
+    try:
+        return float(row[col_index])
+    except (ValueError, TypeError):
+        print(error_message)
         return None
 
-def calculate_total_pieces(stock_data):
-    """Calculate total pieces from stock data, excluding Gizzard."""
+def _as_float(val):
+    """Parse a sheet cell such as '1,200.5' into a float, or None if it is not a finite number."""
     try:
-        headers = stock_data[0]
-        values = stock_data[1]
-        total = 0
-        
-        for i in range(len(headers)):
-            header = headers[i].lower()
-            if header != 'specification' and header != 'gizzard' and header != 'total':
-                try:
-                    val = values[i]
-                    if str(val).strip().replace(',', '').isdigit():
-                        total += int(float(val))
-                except (ValueError, TypeError):
-                    continue
-        return total
-    except Exception as e:
-        print(f"Error calculating total pieces: {str(e)}")
+        num = float(str(val).replace(',', '').strip())
+    except (ValueError, TypeError):
         return None
+    return num if math.isfinite(num) else None
+
+def _parse_qty(val):
+    """Parse a piece count into an int, or None if it is not a whole number."""
+    num = _as_float(val)
+    # Fractional counts are shown as raw text rather than silently truncated
+    if num is None or not num.is_integer():
+        return None
+    return int(num)
+
+def _format_bags(count):
+    """Format a piece count as bags of 20 plus remaining pieces, keeping its sign."""
+    bags, remaining_pieces = divmod(abs(count), 20)
+    
+    # Use proper singular/plural forms
+    bags_text = "1 bag" if bags == 1 else f"{bags:,} bags"
+    pieces_text = "1 piece" if remaining_pieces == 1 else f"{remaining_pieces} pieces"
+    
+    if bags > 0 and remaining_pieces > 0:
+        text = f"{bags_text}, {pieces_text}"
+        return f"-({text})" if count < 0 else text
+    text = bags_text if bags > 0 else pieces_text
+    return f"-{text}" if count < 0 else text
+
+@functools.lru_cache(maxsize=4)
+def normalize_headers(headers):
+    """Return (lowercased, title-cased) copies of a header tuple.
+    
+    Header rows rarely change, so the case mapping is done once per distinct row.
+    """
+    return tuple(h.lower() for h in headers), tuple(h.title() for h in headers)
 
-def calculate_current_differences(stock_data, inventory_balance, gizzard_inventory_balance):
-    """Calculate current inventory balance differences."""
+@functools.lru_cache(maxsize=4)
+def classify_stock_headers(headers):
+    """Return (labels, kinds) for a stock header tuple.
+    
+    labels are the title-cased headers used in messages; kinds are 'specification',
+    'gizzard', 'total' or 'piece'.
+    """
+    lower_headers, labels = normalize_headers(headers)
+    kinds = tuple(h if h in ('specification', 'gizzard', 'total') else 'piece' for h in lower_headers)
+    return labels, kinds
+
+def parse_stock_row(stock_data):
+    """Classify and parse each stock column once.
+    
+    Returns a list of (label, kind, raw_value, parsed_value) tuples where label is the
+    title-cased header and kind is 'specification', 'gizzard', 'total' or 'piece'.
+    Gizzard values are parsed as kg, the other numeric columns as piece counts.
+    """
+    labels, kinds = classify_stock_headers(tuple(stock_data[0]))
+    values = stock_data[1]
+    columns = []
+    
+    for label, kind, val in zip(labels, kinds, values):
+        if kind == 'specification':
+            parsed = None
+        elif kind == 'gizzard':
+            parsed = _as_float(val)
+        else:
+            parsed = _parse_qty(val)
+        columns.append((label, kind, val, parsed))
+    return columns
+
+def calculate_total_pieces(columns):
+    """Calculate total pieces from parsed stock columns, excluding Gizzard."""
+    return sum(parsed for _, kind, _, parsed in columns if kind == 'piece' and parsed is not None)
+
+def calculate_current_differences(stock_data, inventory_balance, gizzard_inventory_balance, stock_columns=None):
+    """Calculate current inventory balance differences.
+    
+    stock_columns is the parse_stock_row result for stock_data; it is parsed here
+    when not supplied.
+    """
     try:
+        columns = stock_columns if stock_columns is not None else parse_stock_row(stock_data)
+        
         # Calculate whole chicken difference
-        total_pieces = calculate_total_pieces(stock_data)
+        total_pieces = calculate_total_pieces(columns)
         whole_chicken_diff = None
-        if total_pieces is not None and inventory_balance is not None:
+        if inventory_balance is not None:
             whole_chicken_diff = int(total_pieces - inventory_balance)
         
         # Calculate gizzard difference
-        headers = stock_data[0]
-        values = stock_data[1]
         current_gizzard_weight = 0
         gizzard_diff = None
         
-        for i in range(len(headers)):
-            if headers[i].lower() == 'gizzard':
-                try:
-                    current_gizzard_weight = float(values[i])
-                    break
-                except (ValueError, TypeError):
-                    current_gizzard_weight = 0
-                    break
+        for _, kind, _, parsed in columns:
+            if kind == 'gizzard':
+                current_gizzard_weight = parsed if parsed is not None else 0
+                break
         
         if current_gizzard_weight > 0 and gizzard_inventory_balance is not None:
             gizzard_diff = current_gizzard_weight - gizzard_inventory_balance
@@ -475,168 +668,113 @@ def calculate_current_differences(stock_data, inventory_balance, gizzard_invento
         print(f"Error calculating current differences: {str(e)}")
         return None, None
 
-def format_stock_section(stock_changes, stock_data, inventory_balance=None, gizzard_inventory_balance=None):
-    """Format the stock section of the alert message."""
-    section = ""
+def format_stock_section(stock_changes, stock_data, inventory_balance=None, gizzard_inventory_balance=None, render_full=True, stock_columns=None):
+    """Format the stock section of the alert message.
+    
+    With render_full=False (nothing stock-related triggered the alert) only a
+    compact placeholder line is returned. stock_columns is the parse_stock_row
+    result for stock_data; it is parsed here when not supplied.
+    """
+    if not render_full:
+        return "*Current Stock Levels:* unchanged\n"
+    
+    lines = []
     
     # Add stock changes if any
     if stock_changes:
-        section += "*Stock Balance Changes:*\n"
+        lines.append("*Stock Balance Changes:*\n")
+        # Look up each changed header's precomputed label and kind
+        headers = tuple(stock_data[0])
+        header_info = dict(zip(headers, zip(*classify_stock_headers(headers))))
         for spec, old_val, new_val in stock_changes:
-            # Capitalize first letter of specification
-            spec = spec.title()
+            spec, kind = header_info.get(spec, (spec.title(), 'piece'))
             
-            # Check if this is a weight-based value (like Gizzard)
-            is_weight = spec.lower() == "gizzard"
-            
-            # Try to convert values to numbers and append appropriate units
-            try:
-                if is_weight:
-                    # Handle weight values (in kg)
-                    old_val_num = float(old_val) if str(old_val).strip().replace('.', '', 1).isdigit() else None
-                    new_val_num = float(new_val) if str(new_val).strip().replace('.', '', 1).isdigit() else None
-                    
-                    if old_val_num is not None:
-                        old_val_str = f"{old_val_num:,.2f} kg"
-                    else:
-                        old_val_str = str(old_val)
-                        
-                    if new_val_num is not None:
-                        new_val_str = f"{new_val_num:,.2f} kg"
-                    else:
-                        new_val_str = str(new_val)
+            # Gizzard is weight-based (kg), everything else is counted in pieces
+            if kind == 'gizzard':
+                old_val_num = _as_float(old_val)
+                new_val_num = _as_float(new_val)
+                old_val_str = f"{old_val_num:,.2f} kg" if old_val_num is not None else str(old_val)
+                new_val_str = f"{new_val_num:,.2f} kg" if new_val_num is not None else str(new_val)
+            else:
+                old_val_num = _parse_qty(old_val)
+                new_val_num = _parse_qty(new_val)
+                if old_val_num is not None:
+                    old_suffix = " piece" if abs(old_val_num) == 1 else " pieces"
+                    old_val_str = f"{old_val_num:,}{old_suffix}"
                 else:
-                    # Handle piece-based values
-                    old_val_num = float(old_val) if str(old_val).strip().replace(',', '').isdigit() else None
-                    new_val_num = float(new_val) if str(new_val).strip().replace(',', '').isdigit() else None
+                    old_val_str = str(old_val)
                     
-                    if old_val_num is not None:
-                        old_suffix = " piece" if old_val_num == 1 else " pieces"
-                        old_val_str = f"{old_val_num:,.0f}{old_suffix}"
-                    else:
-                        old_val_str = str(old_val)
-                        
-                    if new_val_num is not None:
-                        new_suffix = " piece" if new_val_num == 1 else " pieces"
-                        new_val_str = f"{new_val_num:,.0f}{new_suffix}"
-                    else:
-                        new_val_str = str(new_val)
-                
-                section += f"• {spec}: {old_val_str} → {new_val_str}\n"
-            except (ValueError, TypeError):
-                section += f"• {spec}: {old_val} → {new_val}\n"
-        section += "\n"
+                if new_val_num is not None:
+                    new_suffix = " piece" if abs(new_val_num) == 1 else " pieces"
+                    new_val_str = f"{new_val_num:,}{new_suffix}"
+                else:
+                    new_val_str = str(new_val)
+            
+            lines.append(f"• {spec}: {old_val_str} → {new_val_str}\n")
+        lines.append("\n")
     
     # Always add current stock levels
-    section += "*Current Stock Levels:*\n"
-    headers = stock_data[0]
-    values = stock_data[1]
+    lines.append("*Current Stock Levels:*\n")
     total_pieces = 0
     current_gizzard_weight = 0
     
-    for i in range(len(headers)):
+    if stock_columns is None:
+        stock_columns = parse_stock_row(stock_data)
+    
+    for header, kind, val, parsed in stock_columns:
         # Skip 'Specification' header if it exists
-        if headers[i].lower() != 'specification':
-            try:
-                # Capitalize first letter of header
-                header = headers[i].title()
-                
-                # Check if this is a weight-based value (like Gizzard)
-                is_weight = header.lower() == "gizzard"
-                
-                # Try to convert value to number and format appropriately
-                val = values[i]
-                if is_weight:
-                    # Handle weight values (in kg)
-                    if str(val).strip().replace('.', '', 1).isdigit():
-                        current_gizzard_weight = float(val)
-                        formatted_val = f"{current_gizzard_weight:,.2f} kg"
-                    else:
-                        formatted_val = str(val)
-                else:
-                    # Handle piece-based values
-                    if str(val).strip().replace(',', '').isdigit():
-                        total_pieces = int(float(val)) if header.lower() == 'total' else total_pieces
-                        total_val = int(float(val))
-                        bags = total_val // 20
-                        remaining_pieces = total_val % 20
-                        
-                        # Use proper singular/plural forms
-                        bags_text = "1 bag" if bags == 1 else f"{bags:,} bags"
-                        pieces_text = "1 piece" if remaining_pieces == 1 else f"{remaining_pieces} pieces"
-                        
-                        if bags > 0 and remaining_pieces > 0:
-                            formatted_val = f"{bags_text}, {pieces_text}"
-                        elif bags > 0:
-                            formatted_val = bags_text
-                        else:
-                            formatted_val = pieces_text
-                    else:
-                        formatted_val = str(val)
-                section += f"• {header}: {formatted_val}\n"
-            except (ValueError, TypeError):
-                section += f"• {headers[i].title()}: {values[i]}\n"
+        if kind == 'specification':
+            continue
+            
+        if parsed is None:
+            formatted_val = str(val)
+        elif kind == 'gizzard':
+            # Handle weight values (in kg)
+            current_gizzard_weight = parsed
+            formatted_val = f"{current_gizzard_weight:,.2f} kg"
+        else:
+            # Handle piece-based values
+            if kind == 'total':
+                total_pieces = parsed
+            formatted_val = _format_bags(parsed)
+        lines.append(f"• {header}: {formatted_val}\n")
     
     # Add inventory balance comparison if available
     if inventory_balance is not None and total_pieces > 0:
-        section += "\n*Whole Chicken Stock Balance Comparison:*\n"
+        lines.append("\n*Whole Chicken Stock Balance Comparison:*\n")
         difference = int(total_pieces - inventory_balance)  # Convert to integer
         if difference == 0:
-            section += "✅ Whole chicken stock balance matches inventory records\n"
+            lines.append("✅ Whole chicken stock balance matches inventory records\n")
         else:
-            section += f"⚠️ Whole chicken stock balance discrepancy detected:\n"
-            section += f"• Specification Sheet Total: {total_pieces:,} pieces\n"
-            section += f"• Inventory Records Total: {int(inventory_balance):,} pieces\n"  # Convert to integer
-            section += f"• Difference: {abs(difference):,} pieces {'more' if difference > 0 else 'less'} in specification sheet\n"
+            lines.append(f"⚠️ Whole chicken stock balance discrepancy detected:\n")
+            lines.append(f"• Specification Sheet Total: {total_pieces:,} pieces\n")
+            lines.append(f"• Inventory Records Total: {int(inventory_balance):,} pieces\n")  # Convert to integer
+            lines.append(f"• Difference: {abs(difference):,} pieces {'more' if difference > 0 else 'less'} in specification sheet\n")
     
     # Add gizzard inventory balance comparison if available
     if gizzard_inventory_balance is not None and current_gizzard_weight > 0:
-        section += "\n*Gizzard Stock Balance Comparison:*\n"
+        lines.append("\n*Gizzard Stock Balance Comparison:*\n")
         difference = current_gizzard_weight - gizzard_inventory_balance
         if abs(difference) < 0.01:  # Allow for small floating point differences
-            section += "✅ Gizzard stock balance matches inventory records\n"
+            lines.append("✅ Gizzard stock balance matches inventory records\n")
         else:
-            section += f"⚠️ Gizzard stock balance discrepancy detected:\n"
-            section += f"• Specification Sheet Gizzard: {current_gizzard_weight:,.2f} kg\n"
-            section += f"• Inventory Records Gizzard: {gizzard_inventory_balance:,.2f} kg\n"
-            section += f"• Difference: {abs(difference):,.2f} kg {'more' if difference > 0 else 'less'} in specification sheet\n"
+            lines.append(f"⚠️ Gizzard stock balance discrepancy detected:\n")
+            lines.append(f"• Specification Sheet Gizzard: {current_gizzard_weight:,.2f} kg\n")
+            lines.append(f"• Inventory Records Gizzard: {gizzard_inventory_balance:,.2f} kg\n")
+            lines.append(f"• Difference: {abs(difference):,.2f} kg {'more' if difference > 0 else 'less'} in specification sheet\n")
     
-    return section
+    return ''.join(lines)
 
-def format_parts_section(parts_changes, parts_data):
-    """Format the parts section of the alert message."""
-    section = ""
+def format_parts_section(parts_changes, parts_data, render_full=True):
+    """Format the parts section of the alert message.
     
-    # Add parts changes if any
-    if parts_changes:
-        section += "*Parts Weight Changes:*\n"
-        for part, old_val, new_val in parts_changes:
-            # Capitalize first letter of part name
-            part = part.title()
-            
-            # Try to convert values to numbers with weight suffix
-            try:
-                # Check if values are numeric
-                if str(old_val).strip().replace('.', '', 1).isdigit():
-                    old_val_num = float(old_val)
-                    # Use "kg" for all weights as it's a unit, not a count
-                    old_val_str = f"{old_val_num:,.2f} kg"
-                else:
-                    old_val_str = str(old_val)
-                    
-                if str(new_val).strip().replace('.', '', 1).isdigit():
-                    new_val_num = float(new_val)
-                    new_val_str = f"{new_val_num:,.2f} kg"
-                else:
-                    new_val_str = str(new_val)
-                    
-                section += f"• {part}: {old_val_str} → {new_val_str}\n"
-            except (ValueError, TypeError):
-                section += f"• {part}: {old_val} → {new_val}\n"
-        section += "\n"
+    With render_full=False (parts did not trigger the alert) only a compact
+    placeholder line is returned.
+    """
+    if not render_full:
+        return "*Current Parts Weights:* unchanged\n"
     
-    # Always add current parts weights
-    section += "*Current Parts Weights:*\n"
+    lines = []
     
     # Get part headers from row 1 (starting from column B which is index 1)
     part_headers = []
@@ -648,82 +786,128 @@ def format_parts_section(parts_changes, parts_data):
     if len(parts_data) > 1 and len(parts_data[1]) > 1:
         values = parts_data[1][1:]  # Skip "Balance" label in row 2
     
-    # Map values to headers
-    for i in range(min(len(part_headers), len(values))):
-        try:
-            # Format weight values
-            val = values[i]
-            # Capitalize part name
-            part_name = part_headers[i].title()
+    # Part names are title-cased once per header row
+    _, part_names = normalize_headers(tuple(part_headers))
+    
+    # Add parts changes if any
+    if parts_changes:
+        lines.append("*Parts Weight Changes:*\n")
+        part_labels = dict(zip(part_headers, part_names))
+        for part, old_val, new_val in parts_changes:
+            part = part_labels.get(part) or part.title()
             
-            if str(val).strip().replace('.', '', 1).isdigit():
-                # "kg" is always singular as it's a unit
-                formatted_val = f"{float(val):,.2f} kg"
-            else:
-                formatted_val = str(val)
-            section += f"• {part_name}: {formatted_val}\n"
-        except (ValueError, TypeError, IndexError) as e:
-            print(f"Error formatting part {i}: {str(e)}")
-            # Ensure part name is capitalized even in error case
-            part_name = part_headers[i].title() if i < len(part_headers) else 'Unknown'
-            section += f"• {part_name}: {values[i] if i < len(values) else 'N/A'}\n"
-    
-    return section
-
-def send_combined_alert(webhook_url, stock_changes, stock_data, parts_changes, parts_data, inventory_balance=None, gizzard_inventory_balance=None, chicken_difference_changes=None, gizzard_difference_changes=None):
-    """Send combined alert to Google Space."""
+            # Use "kg" for all weights as it's a unit, not a count
+            old_val_num = _as_float(old_val)
+            new_val_num = _as_float(new_val)
+            old_val_str = f"{old_val_num:,.2f} kg" if old_val_num is not None else str(old_val)
+            new_val_str = f"{new_val_num:,.2f} kg" if new_val_num is not None else str(new_val)
+            lines.append(f"• {part}: {old_val_str} → {new_val_str}\n")
+        lines.append("\n")
+    
+    # Always add current parts weights
+    lines.append("*Current Parts Weights:*\n")
+    
+    # Map values to headers
+    for part_name, val in zip(part_names, values):
+        # "kg" is always singular as it's a unit
+        num = _as_float(val)
+        formatted_val = f"{num:,.2f} kg" if num is not None else str(val)
+        lines.append(f"• {part_name}: {formatted_val}\n")
+    
+    return ''.join(lines)
+
+def _alert_digest(message):
+    """Return a short hex digest identifying an alert message body."""
+    return hashlib.blake2b(message.encode('utf-8'), digest_size=16).hexdigest()
+
+def _is_duplicate_alert(digest):
+    """Return True if this digest matches the last alert that was sent."""
+    try:
+        with open(LAST_ALERT_HASH_FILE, 'rb') as f:
+            last_alert = _json_loads(f.read())
+        return last_alert.get('digest') == digest
+    except (OSError, ValueError, TypeError, AttributeError):
+        return False
+
+def _record_alert(digest):
+    """Persist the digest of a successfully sent alert."""
     try:
+        _atomic_write(LAST_ALERT_HASH_FILE, _json_dumps({'digest': digest}))
+    except OSError as e:
+        print(f"Error saving last alert digest: {str(e)}")
+
+def get_changed_mask(stock_changes, parts_changes, chicken_difference_changes, gizzard_difference_changes):
+    """Pack which kinds of change were detected into a bitmask of CHANGED_* flags."""
+    return ((CHANGED_STOCK if stock_changes else 0)
+            | (CHANGED_PARTS if parts_changes else 0)
+            | (CHANGED_CHICKEN_DIFF if chicken_difference_changes else 0)
+            | (CHANGED_GIZZARD_DIFF if gizzard_difference_changes else 0))
+
+def send_combined_alert(webhook_url, stock_changes, stock_data, parts_changes, parts_data, inventory_balance=None, gizzard_inventory_balance=None, chicken_difference_changes=None, gizzard_difference_changes=None, changed_mask=None, stock_columns=None):
+    """Send combined alert to Google Space.
+    
+    Returns True if the alert was sent (or none was needed), False if sending
+    failed, and None if it was skipped as identical to the last alert sent.
+    changed_mask is the CHANGED_* bitmask from get_changed_mask; it is computed
+    from the change lists when not supplied. stock_columns is passed through to
+    format_stock_section.
+    """
+    try:
+        if changed_mask is None:
+            changed_mask = get_changed_mask(stock_changes, parts_changes, chicken_difference_changes, gizzard_difference_changes)
+        
         # Only proceed if there are actual changes
-        if not stock_changes and not parts_changes and not chicken_difference_changes and not gizzard_difference_changes:
+        if not changed_mask:
             print("No changes detected in stock, parts, or differences. No alert needed.")
             return True
         
-        message = "🔔 *Kaduna Inventory Changes Detected*\n\n"
+        lines = ["🔔 *Kaduna Inventory Changes Detected*\n\n"]
         print("Preparing combined changes message")
         
-        # Add difference changes section if there are difference changes
-        difference_changes = []
-        if chicken_difference_changes:
-            difference_changes.extend(chicken_difference_changes)
-        if gizzard_difference_changes:
-            difference_changes.extend(gizzard_difference_changes)
-            
-        if difference_changes:
-            message += "*Inventory Balance Difference Changes:*\n"
-            for change_type, old_val, new_val in difference_changes:
-                if 'Chicken' in change_type:
-                    # Format whole chicken differences as pieces
-                    old_suffix = " piece" if abs(old_val) == 1 else " pieces"
-                    new_suffix = " piece" if abs(new_val) == 1 else " pieces"
-                    old_val_str = f"{old_val:,}{old_suffix}"
-                    new_val_str = f"{new_val:,}{new_suffix}"
+        # Add difference changes section if there are difference changes; each row carries
+        # a DIFF_KIND_* tag, so chicken rows (first) and gizzard rows share one loop
+        if changed_mask & CHANGED_DIFF:
+            lines.append("*Inventory Balance Difference Changes:*\n")
+            for change_type, old_val, new_val, kind in itertools.chain(chicken_difference_changes or (), gizzard_difference_changes or ()):
+                if kind == DIFF_KIND_CHICKEN:
+                    # Whole chicken differences are counted in pieces
+                    lines.append(f"• {change_type}: {old_val:,} {'piece' if abs(old_val) == 1 else 'pieces'} → "
+                                 f"{new_val:,} {'piece' if abs(new_val) == 1 else 'pieces'}\n")
                 else:
-                    # Format gizzard differences as kg
-                    old_val_str = f"{old_val:,.2f} kg"
-                    new_val_str = f"{new_val:,.2f} kg"
-                message += f"• {change_type}: {old_val_str} → {new_val_str}\n"
-            message += "\n"
+                    # Gizzard differences are weights in kg
+                    lines.append(f"• {change_type}: {old_val:,.2f} kg → {new_val:,.2f} kg\n")
+            lines.append("\n")
         
-        # Always add stock section (shows current balances regardless of what triggered alert)
-        message += format_stock_section(stock_changes, stock_data, inventory_balance, gizzard_inventory_balance)
-        message += "\n"
+        # Stock section is rendered in full for stock or difference changes, since it carries
+        # the inventory balance comparison; otherwise a compact line is enough
+        lines.append(format_stock_section(stock_changes, stock_data, inventory_balance, gizzard_inventory_balance,
+                                          render_full=bool(changed_mask & (CHANGED_STOCK | CHANGED_DIFF)),
+                                          stock_columns=stock_columns))
+        lines.append("\n")
         
-        # Always add parts section (shows current weights regardless of what triggered alert)
-        message += format_parts_section(parts_changes, parts_data)
+        # Parts section is rendered in full only when parts changed
+        lines.append(format_parts_section(parts_changes, parts_data, render_full=bool(changed_mask & CHANGED_PARTS)))
+        
+        # Skip re-sending an identical alert (e.g. when state failed to save last run);
+        # the digest covers the body only, since the timestamp footer always differs
+        digest = _alert_digest("".join(lines))
+        if _is_duplicate_alert(digest):
+            print("Identical alert was already sent, skipping webhook request")
+            return None
         
         # Get current time in WAT
-        wat_tz = pytz.timezone('Africa/Lagos')
-        current_time = datetime.now(pytz.UTC).astimezone(wat_tz)
-        message += f"\n_Updated at: {current_time.strftime('%Y-%m-%d %I:%M:%S %p')} WAT_"
+        lines.append(f"\n_Updated at: {datetime.now(LAGOS_TZ).strftime(ALERT_TIME_FORMAT)} WAT_")
         
+        message = "".join(lines)
         payload = {
             "text": message
         }
         
         print("Sending webhook request...")
-        response = requests.post(webhook_url, json=payload, timeout=10)  # Add timeout
+        response = _SESSION.post(webhook_url, json=payload, timeout=WEBHOOK_TIMEOUT)
         response.raise_for_status()  # Raise exception for bad status codes
         print(f"Webhook response status: {response.status_code}")
+        _record_alert(digest)
         return True
     except requests.exceptions.RequestException as e:
         print(f"Error sending alert to Google Space: {str(e)}")
@@ -741,32 +925,35 @@ def main():
         print("Initializing Google Sheets service...")
         service = get_service()
         
-        # Get current stock data
-        stock_data = get_sheet_data(service, STOCK_SHEET_NAME, STOCK_RANGE)
-        
-        # Get current parts data
-        parts_data = get_sheet_data(service, PARTS_SHEET_NAME, PARTS_RANGE)
-        
-        # Get inventory balance for comparison
-        inventory_balance = get_inventory_balance(service)
-        
-        # Get gizzard inventory balance for comparison
-        gizzard_inventory_balance = get_gizzard_inventory_balance(service)
-        
-        # Load previous states
-        previous_stock_data = load_previous_state(STOCK_STATE_FILE)
-        previous_parts_data = load_previous_state(PARTS_STATE_FILE)
-        previous_chicken_diff = load_previous_state(WHOLE_CHICKEN_DIFF_STATE_FILE)
-        previous_gizzard_diff = load_previous_state(GIZZARD_DIFF_STATE_FILE)
+        # The Sheets fetches and state file reads are independent, so run them concurrently
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            # Current stock and parts data (one request) and inventory balances (one request)
+            spec_future = executor.submit(get_all_spec_data, service)
+            inventory_future = executor.submit(get_inventory_balances, service)
+            
+            # Previous states
+            previous_stock_future = executor.submit(load_tabular_state, STOCK_STATE_FILE)
+            previous_parts_future = executor.submit(load_tabular_state, PARTS_STATE_FILE)
+            previous_chicken_future = executor.submit(load_scalar_state, WHOLE_CHICKEN_DIFF_STATE_FILE)
+            previous_gizzard_future = executor.submit(load_scalar_state, GIZZARD_DIFF_STATE_FILE)
+            
+            stock_data, parts_data = spec_future.result()
+            inventory_balance, gizzard_inventory_balance = inventory_future.result()
+            previous_stock_data = previous_stock_future.result()
+            previous_parts_data = previous_parts_future.result()
+            previous_chicken_diff = previous_chicken_future.result()
+            previous_gizzard_diff = previous_gizzard_future.result()
         
         # Calculate current differences
-        current_chicken_diff, current_gizzard_diff = calculate_current_differences(stock_data, inventory_balance, gizzard_inventory_balance)
+        # Parse the stock row once; the differences and the alert both use it
+        stock_columns = parse_stock_row(stock_data)
+        current_chicken_diff, current_gizzard_diff = calculate_current_differences(stock_data, inventory_balance, gizzard_inventory_balance, stock_columns)
         
-        # Initialize flags for state updates
-        stock_state_needs_update = True
-        parts_state_needs_update = True
-        chicken_diff_state_needs_update = True
-        gizzard_diff_state_needs_update = True
+        # Only rewrite state files whose stored content would actually change
+        stock_state_needs_update = _canonical_state(stock_data) != previous_stock_data
+        parts_state_needs_update = _canonical_state(parts_data) != previous_parts_data
+        chicken_diff_state_needs_update = current_chicken_diff != previous_chicken_diff
+        gizzard_diff_state_needs_update = current_gizzard_diff != previous_gizzard_diff
         
         # Check for changes in stock data
         stock_changes = []
@@ -785,7 +972,7 @@ def main():
             parts_changes = detect_parts_changes(previous_parts_data, parts_data)
         
         # Check for changes in whole chicken inventory balance differences
-        chicken_difference_changes = []
+        chicken_difference_changes = ()
         if previous_chicken_diff is None:
             print("No previous whole chicken difference state found, initializing state file...")
         else:
@@ -793,32 +980,42 @@ def main():
             chicken_difference_changes = detect_chicken_difference_changes(previous_chicken_diff, current_chicken_diff)
         
         # Check for changes in gizzard inventory balance differences
-        gizzard_difference_changes = []
+        gizzard_difference_changes = ()
         if previous_gizzard_diff is None:
             print("No previous gizzard difference state found, initializing state file...")
         else:
             print("Checking for gizzard difference changes...")
             gizzard_difference_changes = detect_gizzard_difference_changes(previous_gizzard_diff, current_gizzard_diff)
         
-        # Send combined alert if there are any changes
-        if stock_changes or parts_changes or chicken_difference_changes or gizzard_difference_changes:
-            print("Changes detected, sending combined alert...")
-            if send_combined_alert(webhook_url, stock_changes, stock_data, parts_changes, parts_data, inventory_balance, gizzard_inventory_balance, chicken_difference_changes, gizzard_difference_changes):
-                print("Alert sent successfully, updating state files...")
+        changed_mask = get_changed_mask(stock_changes, parts_changes, chicken_difference_changes, gizzard_difference_changes)
+        
+        # Send the combined alert (if there are any changes) on a worker thread and
+        # persist changed state files while the webhook request is in flight
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            alert_future = None
+            if changed_mask:
+                print("Changes detected, sending combined alert...")
+                alert_future = executor.submit(send_combined_alert, webhook_url, stock_changes, stock_data, parts_changes, parts_data, inventory_balance, gizzard_inventory_balance, chicken_difference_changes, gizzard_difference_changes, changed_mask, stock_columns)
             else:
-                print("Failed to send alert, but will still update state files...")
-        else:
-            print("No changes detected in stock, parts, or differences, updating state files...")
-        
-        # Always update all state files at the end
-        if stock_state_needs_update:
-            save_current_state(stock_data, STOCK_STATE_FILE)
-        if parts_state_needs_update:
-            save_current_state(parts_data, PARTS_STATE_FILE)
-        if chicken_diff_state_needs_update:
-            save_current_state(current_chicken_diff, WHOLE_CHICKEN_DIFF_STATE_FILE)
-        if gizzard_diff_state_needs_update:
-            save_current_state(current_gizzard_diff, GIZZARD_DIFF_STATE_FILE)
+                print("No changes detected in stock, parts, or differences")
+            
+            if stock_state_needs_update:
+                save_tabular_state(stock_data, STOCK_STATE_FILE)
+            if parts_state_needs_update:
+                save_tabular_state(parts_data, PARTS_STATE_FILE)
+            if chicken_diff_state_needs_update:
+                save_scalar_state(current_chicken_diff, WHOLE_CHICKEN_DIFF_STATE_FILE)
+            if gizzard_diff_state_needs_update:
+                save_scalar_state(current_gizzard_diff, GIZZARD_DIFF_STATE_FILE)
+            
+            if alert_future is not None:
+                alert_result = alert_future.result()
+                if alert_result is None:
+                    print("Alert skipped, identical to the last alert sent")
+                elif alert_result:
+                    print("Alert sent successfully")
+                else:
+                    print("Failed to send alert, state files were still updated")
 
     except APIError as e:
         print(f"API Error: {str(e)}")